@@ -0,0 +1,133 @@
+import os
+import sys
+import importlib.util
+from concurrent.futures import Future
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('catboost')
+pytest.importorskip('sklearn')
+pytest.importorskip('flask')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_script(name, filename):
+    # the scripts have hyphenated names, so they can't be imported directly
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+train_model = load_script('train_model', 'train-model.py')
+flask_app = load_script('flask_app', 'flask-app.py')
+
+
+# SUCCESSIVE HALVING
+class FakeExecutor:
+    # runs a trial synchronously: params hold the fold score and the
+    # iteration at which early stopping kicks in
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, trial, params, fold, iterations, od_wait,
+               thread_count, init_model=None):
+        self.calls.append((trial, fold, iterations, init_model))
+        start = init_model['trees'] if init_model else 0
+        trees = start + min(iterations, params['stop'] - start)
+        future = Future()
+        future.set_result((trial, fold, {
+            'model': {'trial': trial, 'fold': fold, 'trees': trees},
+            'score': params['score'],
+            'best_iteration': trees - 1,
+            'trees': trees,
+        }))
+        return future
+
+
+def submitted(executor, iterations):
+    return sorted({call[0] for call in executor.calls
+                   if call[2] == iterations})
+
+
+def test_rung_budgets():
+    assert train_model.rung_budgets(100, 800, 3) == [100, 300, 800]
+    assert train_model.rung_budgets(30, 270, 3) == [30, 90, 270]
+    assert train_model.rung_budgets(50, 50, 3) == [50]
+
+
+def test_successive_halving_promotes_top_trials():
+    trials = [{'score': t / 10, 'stop': 1000} for t in range(9)]
+    executor = FakeExecutor()
+
+    best, results = train_model.successive_halving(
+        executor, trials, 2, [10, 30, 90], 3, 20, 1)
+
+    assert best == 8
+    assert submitted(executor, 10) == list(range(9))
+    # promoted trials only train the extra iterations of the next rung
+    assert submitted(executor, 20) == [6, 7, 8]
+    assert submitted(executor, 60) == [8]
+    assert results[8]['budget'] == 90
+    assert results[0]['budget'] == 10
+
+
+def test_successive_halving_continues_fold_models():
+    trials = [{'score': 0.5, 'stop': 1000}, {'score': 0.9, 'stop': 1000}]
+    executor = FakeExecutor()
+
+    train_model.successive_halving(executor, trials, 2, [10, 30], 2, 20, 1)
+
+    continued = [call for call in executor.calls if call[2] == 20]
+    assert [(trial, fold) for trial, fold, _, _ in continued] == [(1, 0), (1, 1)]
+    for trial, fold, _, init_model in continued:
+        assert init_model == {'trial': trial, 'fold': fold, 'trees': 10}
+
+
+def test_successive_halving_keeps_converged_trials():
+    # trial 1 early stops before the first budget and is not retrained
+    trials = [{'score': 0.5, 'stop': 1000}, {'score': 0.9, 'stop': 5},
+              {'score': 0.7, 'stop': 1000}, {'score': 0.6, 'stop': 1000}]
+    executor = FakeExecutor()
+
+    best, results = train_model.successive_halving(
+        executor, trials, 2, [10, 30], 2, 20, 1)
+
+    assert best == 1
+    assert submitted(executor, 20) == [2]
+    assert results[1]['converged']
+    assert results[1]['budget'] == 10
+    assert results[1]['best_iteration'] == 4
+
+
+# FEATURE ALIGNMENT
+ARTIFACT = {
+    'version': 'test',
+    'feature_columns': ['Age', 'Country', 'DevType_student',
+                        'LanguageWorkedWith_python'],
+}
+
+
+def test_align_features_fills_missing_one_hot_columns():
+    X = pd.DataFrame({'LanguageWorkedWith_python': [1, 0],
+                      'Country': pd.Categorical(['vietnam', 'australia']),
+                      'Age': [30.0, 25.0],
+                      'DevType_unseen': [0, 1]})
+
+    aligned = flask_app.align_features(X, ARTIFACT)
+
+    assert aligned.columns.tolist() == ARTIFACT['feature_columns']
+    assert aligned['DevType_student'].tolist() == [0, 0]
+    assert aligned['Age'].tolist() == [30.0, 25.0]
+
+
+def test_align_features_rejects_missing_non_one_hot_columns():
+    X = pd.DataFrame({'Age': [30.0], 'DevType_student': [1],
+                      'LanguageWorkedWith_python': [0]})
+
+    with pytest.raises(ValueError, match='Country'):
+        flask_app.align_features(X, ARTIFACT)
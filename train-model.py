@@ -0,0 +1,318 @@
+import os
+import time
+import pickle
+import argparse
+import numpy as np
+import sklearn
+import catboost
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import accuracy_score
+from catboost import CatBoostClassifier, Pool
+
+from preprocessing import preprocessing_data, train_test_split, data_key
+
+# Retraining pipeline
+# Runs a successive halving search over CatBoost parameters on a process pool,
+# refits the best configuration and writes a versioned artifact for flask-app.py
+
+CACHE_DIR = 'cache'
+ARTIFACT_DIR = 'models'
+LATEST_PATH = os.path.join(ARTIFACT_DIR, 'LATEST')
+FOLD_SEED = 42
+# os.cpu_count() returns None when the count can't be determined
+CPU_COUNT = os.cpu_count() or 1
+
+# parameters kept fixed for every trial (taken from the notebook model)
+BASE_PARAMS = {
+    'loss_function': 'MultiClass',
+    'eval_metric': 'Accuracy',
+    'leaf_estimation_method': 'Newton',
+    'random_seed': 42,
+    'allow_writing_files': False,
+    'verbose': False,
+}
+
+# hand tuned parameters from Assignment3.ipynb, always evaluated as trial 0
+NOTEBOOK_PARAMS = {
+    'learning_rate': 0.08,
+    'depth': 8,
+    'l2_leaf_reg': 7.898,
+    'bagging_temperature': 0.2,
+    'random_strength': 1.0,
+}
+
+
+# CACHE THE PREPROCESSED DATA AND FOLDS
+def build_cache(key, n_folds):
+    # preprocessing_data() is slow (row by row one-hot encoding), so its output
+    # is reused until the survey csv, preprocessing.py or the folds change
+    name = '%s-%d-%d' % (key[:16], n_folds, FOLD_SEED)
+    path = os.path.join(CACHE_DIR, 'folds-' + name + '.pkl')
+    if os.path.exists(path):
+        return path
+
+    X, y = preprocessing_data()
+    X_train, y_train, X_test, y_test = train_test_split(X, y)
+
+    # same splitter as the notebook, the hold-out set stays out of the search
+    kf = StratifiedKFold(n_splits=n_folds, random_state=FOLD_SEED,
+                         shuffle=True)
+    folds = list(kf.split(X_train, y_train))
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as wf:
+        pickle.dump({'X_train': X_train, 'y_train': y_train,
+                     'X_test': X_test, 'y_test': y_test,
+                     'folds': folds}, wf)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_cache(path):
+    with open(path, 'rb') as rf:
+        return pickle.load(rf)
+
+
+def cat_features(X):
+    return [i for i, dtype in enumerate(X.dtypes) if dtype.name == 'category']
+
+
+# WORKER PROCESS
+# each worker loads the cache once and builds the fold pools on first use,
+# this only avoids unpickling the data per task, the cost is in training
+_data = None
+_pools = {}
+
+
+def init_worker(cache_path):
+    global _data
+    _data = load_cache(cache_path)
+    _pools.clear()
+
+
+def fold_pools(fold):
+    if fold not in _pools:
+        X, y = _data['X_train'], _data['y_train']
+        train_idx, valid_idx = _data['folds'][fold]
+        cat_idx = cat_features(X)
+        _pools[fold] = (
+            Pool(X.iloc[train_idx], y.iloc[train_idx], cat_features=cat_idx),
+            Pool(X.iloc[valid_idx], y.iloc[valid_idx], cat_features=cat_idx),
+        )
+    return _pools[fold]
+
+
+def evaluate_fold(trial, params, fold, iterations, od_wait, thread_count,
+                  init_model=None):
+    # init_model continues a fold model from the previous rung, so only the
+    # extra iterations are trained
+    train_pool, valid_pool = fold_pools(fold)
+    model = CatBoostClassifier(iterations=iterations,
+                               od_type='Iter', od_wait=od_wait,
+                               thread_count=thread_count,
+                               **BASE_PARAMS, **params)
+    # keep every tree so the next rung can continue from the last one
+    model.fit(train_pool, eval_set=valid_pool, use_best_model=False,
+              init_model=init_model)
+
+    # the history only covers the trees added by this fit
+    history = model.get_evals_result()['validation']['Accuracy']
+    best = int(np.argmax(history))
+    return trial, fold, {
+        'model': model,
+        'score': float(history[best]),
+        'best_iteration': model.tree_count_ - len(history) + best,
+        'trees': model.tree_count_,
+    }
+
+
+# HYPERPARAMETER SEARCH
+def sample_params(n_trials, seed):
+    rng = np.random.RandomState(seed)
+    trials = [dict(NOTEBOOK_PARAMS)]
+    for _ in range(n_trials - 1):
+        trials.append({
+            'learning_rate': float(np.exp(rng.uniform(np.log(0.02), np.log(0.3)))),
+            'depth': int(rng.randint(4, 11)),
+            'l2_leaf_reg': float(np.exp(rng.uniform(np.log(1), np.log(10)))),
+            'bagging_temperature': float(rng.uniform(0, 1)),
+            'random_strength': float(rng.uniform(0, 2)),
+        })
+    return trials
+
+
+def rung_budgets(min_iterations, max_iterations, eta):
+    budgets = [min_iterations]
+    while budgets[-1] < max_iterations:
+        budgets.append(min(budgets[-1] * eta, max_iterations))
+    return budgets
+
+
+def successive_halving(executor, trials, n_folds, budgets, eta, od_wait,
+                       workers):
+    folds = {}
+    results = {}
+    alive = list(range(len(trials)))
+    prev_budget = 0
+
+    for rung, budget in enumerate(budgets):
+        start = time.time()
+        # folds that early stopped would not improve with a bigger budget,
+        # keep their previous result instead of training them further
+        tasks = [(t, fold) for t in alive for fold in range(n_folds)
+                 if t not in folds or not folds[t][fold]['converged']]
+        # fewer tasks in the later rungs, give each one more threads
+        thread_count = max(1, CPU_COUNT // min(workers, max(1, len(tasks))))
+
+        futures = []
+        for t, fold in tasks:
+            prev = folds.get(t, {}).get(fold)
+            futures.append(executor.submit(
+                evaluate_fold, t, trials[t], fold, budget - prev_budget,
+                od_wait, thread_count, prev['model'] if prev else None))
+        try:
+            for future in as_completed(futures):
+                trial, fold, result = future.result()
+                prev = folds.setdefault(trial, {}).get(fold)
+                if prev is not None and prev['score'] >= result['score']:
+                    # the extra trees didn't beat the previous best
+                    result['score'] = prev['score']
+                    result['best_iteration'] = prev['best_iteration']
+                result['converged'] = result['trees'] < budget
+                folds[trial][fold] = result
+        except BaseException:
+            # fail fast, don't let the pool run the queued fits on shutdown
+            for future in futures:
+                future.cancel()
+            raise
+
+        for t in sorted({t for t, _ in tasks}):
+            fold_results = list(folds[t].values())
+            results[t] = {
+                'score': float(np.mean([r['score'] for r in fold_results])),
+                'best_iteration': int(np.mean([r['best_iteration']
+                                               for r in fold_results])),
+                'converged': all(r['converged'] for r in fold_results),
+                'budget': budget,
+            }
+
+        alive.sort(key=lambda t: results[t]['score'], reverse=True)
+        print('rung %d: %d iterations, %d trials, %d fits, best cv accuracy '
+              '%.4f (%.0fs)' % (rung, budget, len(alive), len(tasks),
+                                results[alive[0]]['score'], time.time() - start))
+
+        if rung < len(budgets) - 1:
+            # prune, only the top 1/eta trials move on to the next budget
+            alive = alive[:max(1, len(alive) // eta)]
+            # drop the fold models of pruned trials
+            folds = {t: folds[t] for t in alive}
+        prev_budget = budget
+
+    return alive[0], results
+
+
+# FINAL MODEL AND ARTIFACT
+def fit_final(data, params, iterations):
+    X_train, y_train = data['X_train'], data['y_train']
+    model = CatBoostClassifier(iterations=iterations, thread_count=-1,
+                               **BASE_PARAMS, **params)
+    model.fit(X_train, y_train, cat_features=cat_features(X_train))
+
+    y_pred = np.squeeze(model.predict(data['X_test']))
+    accuracy = accuracy_score(data['y_test'], y_pred)
+    return model, accuracy
+
+
+def artifact_version():
+    now = time.time()
+    return '%s-%03d' % (time.strftime('%Y%m%d-%H%M%S', time.localtime(now)),
+                        int(now * 1000) % 1000)
+
+
+def save_artifact(artifact):
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    filename = 'model-' + artifact['version'] + '.pkl'
+    # 'xb' fails instead of overwriting an artifact with the same version
+    with open(os.path.join(ARTIFACT_DIR, filename), 'xb') as wf:
+        pickle.dump(artifact, wf)
+
+    # switch the served model only after the artifact is fully written
+    tmp_path = LATEST_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(filename)
+    os.replace(tmp_path, LATEST_PATH)
+    return filename
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Search CatBoost parameters and retrain the served model')
+    parser.add_argument('--trials', type=int, default=9)
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=CPU_COUNT)
+    parser.add_argument('--min-iterations', type=int, default=30)
+    parser.add_argument('--max-iterations', type=int, default=270)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--od-wait', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.trials < 1:
+        parser.error('--trials must be at least 1')
+    if args.folds < 2:
+        parser.error('--folds must be at least 2')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.min_iterations < 1:
+        parser.error('--min-iterations must be at least 1')
+    if args.max_iterations < args.min_iterations:
+        parser.error('--max-iterations must not be below --min-iterations')
+    if args.eta < 2:
+        parser.error('--eta must be at least 2')
+    if args.od_wait < 1:
+        parser.error('--od-wait must be at least 1')
+    return args
+
+
+# main
+if __name__ == '__main__':
+    args = parse_args()
+    start = time.time()
+
+    key = data_key()
+    cache_path = build_cache(key, args.folds)
+    trials = sample_params(args.trials, args.seed)
+    budgets = rung_budgets(args.min_iterations, args.max_iterations, args.eta)
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(cache_path,)) as executor:
+        best, results = successive_halving(executor, trials, args.folds,
+                                           budgets, args.eta, args.od_wait,
+                                           args.workers)
+
+    data = load_cache(cache_path)
+    params = trials[best]
+    iterations = results[best]['best_iteration'] + 1
+    model, accuracy = fit_final(data, params, iterations)
+
+    artifact = {
+        'version': artifact_version(),
+        'model': model,
+        'feature_columns': data['X_train'].columns.tolist(),
+        'cat_features': [data['X_train'].columns[i]
+                         for i in cat_features(data['X_train'])],
+        'params': dict(BASE_PARAMS, iterations=iterations, **params),
+        # preprocessing state: the data the model was trained on and the
+        # libraries needed to load it
+        'data_key': key,
+        'sklearn_version': sklearn.__version__,
+        'catboost_version': catboost.__version__,
+        'cv_accuracy': results[best]['score'],
+        'holdout_accuracy': accuracy,
+    }
+    filename = save_artifact(artifact)
+    print('saved %s: cv accuracy %.4f, hold-out accuracy %.4f (%.0fs)'
+          % (filename, artifact['cv_accuracy'], accuracy, time.time() - start))